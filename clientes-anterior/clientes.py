@@ -13,32 +13,191 @@ Características:
 - Búsqueda avanzada de clientes
 - Reportes detallados
 - Ranking de mejores clientes
-- Persistencia de datos en JSON
+- Persistencia de datos en JSON (snapshot + bitácora de cambios)
 - Análisis básico de ventas
 
 Uso:
     python3 clientes.py
 
 Requisitos:
-    - Python 3.6+
-    - Módulos: json, datetime (incluidos en Python estándar)
+    - Python 3.10+
+    - Módulos: json, time (incluidos en Python estándar)
+    - Opcional: orjson (serialización JSON más rápida)
 """
 
+import atexit
+import csv
+import heapq
 import json
+import mmap
 import os
-from datetime import datetime, timedelta
-from typing import Dict, List, Tuple, Optional
+import sys
+import time
+import unicodedata
+import weakref
+from dataclasses import asdict, dataclass, field, is_dataclass
+from operator import attrgetter
+from typing import Any, Dict, Iterable, List, Tuple, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _json_dumps(datos: Any, indentar: bool = True) -> bytes:
+    """Serializa a JSON (UTF-8) usando orjson si está disponible."""
+    if orjson is not None:
+        opciones = orjson.OPT_NON_STR_KEYS
+        if indentar:
+            opciones |= orjson.OPT_INDENT_2
+        return orjson.dumps(datos, option=opciones)
+    return json.dumps(datos, indent=2 if indentar else None,
+                      ensure_ascii=False, default=_registro_a_dict).encode("utf-8")
+
+
+def _registro_a_dict(obj: Any) -> Dict:
+    """Convierte registros (dataclasses) a dict para el módulo json estándar."""
+    if is_dataclass(obj):
+        return asdict(obj)
+    raise TypeError(f"Objeto de tipo {type(obj).__name__} no serializable a JSON")
+
+
+def _json_loads(contenido: bytes) -> Any:
+    """Deserializa JSON usando orjson si está disponible."""
+    if orjson is not None:
+        return orjson.loads(contenido)
+    return json.loads(contenido)
+
+
+# Tamaño a partir del cual los snapshots se leen con mmap en lugar de read()
+_MIN_BYTES_MMAP = 64 * 1024
+
+
+def _cargar_json_archivo(ruta: str) -> Any:
+    """
+    Lee y deserializa un archivo JSON.
+    
+    Con orjson y archivos grandes, el contenido se parsea directamente desde
+    las páginas mapeadas en memoria, sin copiarlo antes a un objeto bytes.
+    """
+    with open(ruta, "rb") as f:
+        if orjson is None or os.fstat(f.fileno()).st_size < _MIN_BYTES_MMAP:
+            return _json_loads(f.read())
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as contenido:
+                return orjson.loads(contenido)
+
+
+def _escribir_json_atomico(ruta: str, datos: Any) -> None:
+    """Escribe un archivo JSON completo o, si falla, deja intacto el anterior."""
+    temporal = ruta + ".tmp"
+    with open(temporal, "wb") as f:
+        f.write(_json_dumps(datos))
+    os.replace(temporal, ruta)
+
+
+def _normalizar_material(material: str) -> str:
+    """Normaliza un nombre de material: minúsculas, sin acentos ni espacios extremos."""
+    descompuesto = unicodedata.normalize("NFD", material.strip().lower())
+    return "".join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+def _acumular_material(acumulados: Dict, material: str, peso: float,
+                       total: float, count: int = 1) -> None:
+    """Suma peso, total y número de compras al acumulado de un material."""
+    stats = acumulados.setdefault(material, {"peso": 0.0, "total": 0.0, "count": 0})
+    stats["peso"] += peso
+    stats["total"] += total
+    stats["count"] += count
+
+
+@dataclass(slots=True)
+class Compra:
+    """
+    Compra de material a un cliente.
+    
+    Attributes:
+        ts (int): Momento de la compra (segundos epoch)
+        material (str): Nombre del material
+        peso (float): Peso en kilogramos
+        precio_kg (float): Precio pagado por kg
+        total (float): Importe total de la compra
+    """
+    ts: int
+    material: str
+    peso: float
+    precio_kg: float
+    total: float
+    
+    @property
+    def fecha(self) -> str:
+        """Fecha legible de la compra."""
+        return time.strftime("%Y-%m-%d %H:%M", time.localtime(self.ts))
+    
+    @classmethod
+    def desde_dict(cls, datos: Dict) -> "Compra":
+        """
+        Crea una compra a partir de su forma JSON.
+        
+        Las compras de versiones anteriores guardan la cadena 'fecha' (y 'mes')
+        en lugar de 'ts'; se convierten a timestamp.
+        """
+        ts = datos.get("ts")
+        if ts is None:
+            ts = int(time.mktime(time.strptime(datos["fecha"], "%Y-%m-%d %H:%M")))
+        return cls(ts, datos["material"], datos["peso"], datos["precio_kg"], datos["total"])
+
+
+@dataclass(slots=True)
+class Cliente:
+    """
+    Resumen de un cliente (el historial de compras se guarda por separado).
+    
+    Attributes:
+        nombre (str): Nombre completo
+        telefono (str): Número de teléfono
+        direccion (str): Dirección completa
+        fecha_registro (str): Fecha de alta (YYYY-MM-DD)
+        compras_totales (float): Importe acumulado de compras
+        peso_total (float): Peso acumulado en kg
+        num_transacciones (int): Número de compras
+        materiales (dict): Acumulados de peso, total y compras por material
+    """
+    nombre: str
+    telefono: str
+    direccion: str
+    fecha_registro: str
+    compras_totales: float = 0.0
+    peso_total: float = 0.0
+    num_transacciones: int = 0
+    materiales: Dict[str, Dict] = field(default_factory=dict)
+
 
 class SistemaClientes:
     """
     Clase principal para gestionar el sistema de clientes de la recicladora.
     
+    Los cambios se persisten como eventos en una bitácora JSON-lines
+    (append-only) y se compactan periódicamente en el snapshot JSON. El
+    snapshot guarda solo el resumen de cada cliente; el historial de compras
+    vive en un archivo por cliente que se lee al consultarlo y se reescribe
+    solo si el cliente cambió.
+    
     Attributes:
-        clientes (dict): Diccionario con todos los datos de clientes
-        archivo_datos (str): Ruta del archivo JSON para persistencia
-        precios_materiales (dict): Precios por kg de cada material
+        clientes (Dict[int, Cliente]): Resumen de cada cliente (sin historial de compras)
+        archivo_datos (str): Ruta del archivo JSON de resumen
+        archivo_bitacora (str): Ruta de la bitácora de cambios pendientes
+        archivo_rechazados (str): Ruta donde se conservan eventos que no se pudieron aplicar
+        directorio_historial (str): Carpeta con un historial JSON por cliente
+        precios_materiales (dict): Precios por kg de cada material (claves normalizadas)
+        materiales_globales (dict): Acumulados por material de clientes activos
+        inactivos (set): IDs de clientes dados de baja
     """
     
+    # Número de eventos en bitácora tras los cuales se compacta el snapshot
+    EVENTOS_POR_COMPACTACION = 500
+    
     def __init__(self, archivo_datos: str = "clientes.json"):
         """
         Inicializa el sistema de clientes.
@@ -47,19 +206,57 @@ class SistemaClientes:
             archivo_datos (str): Nombre del archivo para guardar datos
         """
         self.archivo_datos = archivo_datos
+        self.archivo_bitacora = os.path.splitext(archivo_datos)[0] + ".journal.jsonl"
+        self.archivo_rechazados = os.path.splitext(archivo_datos)[0] + ".rechazados.journal.jsonl"
+        self.directorio_historial = os.path.splitext(archivo_datos)[0] + "_historial"
         self.clientes = {}
+        self.materiales_globales = {}
+        self.inactivos = set()
+        self._bitacora = None
+        self._eventos_pendientes = 0
+        # Líneas de la bitácora no aplicadas; se conservan antes de vaciarla
+        self._lineas_rechazadas = []
+        # Si la carga falla, los archivos existentes no se sobrescriben
+        self._carga_fallida = False
+        # Estado de los archivos tras la última lectura o escritura propia, para
+        # detectar cambios de otra instancia; si los hay, esta deja de escribir
+        self._snapshot_conocido = None
+        self._tam_bitacora = 0
+        self._desactualizado = False
+        # Número de secuencia del último evento aplicado
+        self._seq = 0
+        # Historiales ya leídos y compras de clientes cuyo historial no se ha leído
+        self._historiales = {}
+        self._compras_pendientes = {}
+        # Clientes cuyo archivo de historial debe reescribirse
+        self._sucios = set()
+        self._indice_telefonos = {}
+        self._indice_busqueda = {}
+        self._siguiente_id = 1
         self.precios_materiales = {
             "aluminio": 25.0,
             "papel": 3.0,
             "plastico": 8.0,
-            "plástico": 8.0,
             "vidrio": 5.0,
             "carton": 2.5,
-            "cartón": 2.5,
             "metal": 15.0,
             "cobre": 80.0
         }
+        # Nombre a mostrar por material, indexado por su clave normalizada
+        self._nombres_material = {
+            "aluminio": "Aluminio",
+            "papel": "Papel",
+            "plastico": "Plástico",
+            "vidrio": "Vidrio",
+            "carton": "Cartón",
+            "metal": "Metal",
+            "cobre": "Cobre"
+        }
+        # Clave normalizada de cada texto de material ya visto
+        self._claves_material = {}
         self.cargar_datos()
+        # Se compacta al terminar el proceso, también en uso desde scripts
+        _instancias_abiertas.add(self)
     
     def agregar_cliente(self, nombre: str, telefono: str, direccion: str) -> int:
         """
@@ -77,24 +274,26 @@ class SistemaClientes:
             raise ValueError("El nombre no puede estar vacío")
         
         # Verificar si el cliente ya existe
-        for cliente_id, datos in self.clientes.items():
-            if datos["telefono"] == telefono:
-                print(f"⚠️  Cliente con teléfono {telefono} ya existe (ID: {cliente_id})")
-                return cliente_id
-        
-        cliente_id = max(self.clientes.keys(), default=0) + 1
-        self.clientes[cliente_id] = {
-            "nombre": nombre.strip().title(),
-            "telefono": telefono.strip(),
-            "direccion": direccion.strip(),
-            "fecha_registro": datetime.now().strftime("%Y-%m-%d"),
-            "compras_totales": 0.0,
-            "peso_total": 0.0,
-            "num_transacciones": 0,
-            "historial": [],
-            "activo": True
-        }
-        self.guardar_datos()
+        telefono = telefono.strip()
+        if telefono in self._indice_telefonos:
+            cliente_id = self._indice_telefonos[telefono]
+            print(f"⚠️  Cliente con teléfono {telefono} ya existe (ID: {cliente_id})")
+            return cliente_id
+        
+        cliente_id = self._siguiente_id
+        self._siguiente_id += 1
+        self.clientes[cliente_id] = Cliente(
+            nombre=nombre.strip().title(),
+            telefono=telefono,
+            direccion=direccion.strip(),
+            fecha_registro=time.strftime("%Y-%m-%d")
+        )
+        self._indice_telefonos[telefono] = cliente_id
+        self._indexar_busqueda(cliente_id, self.clientes[cliente_id])
+        self._historiales[cliente_id] = []
+        self._sucios.add(cliente_id)
+        self._registrar_evento(self._nuevo_evento("add_client", cliente_id,
+                                                  self.clientes[cliente_id]))
         print(f"✅ Cliente {nombre} agregado con ID: {cliente_id}")
         return cliente_id
     
@@ -111,40 +310,142 @@ class SistemaClientes:
         Returns:
             float: Total de la compra
         """
+        return self.registrar_compras([(cliente_id, material, peso, precio_kg)],
+                                      verbose=True)[0]
+    
+    def registrar_compras(self, compras: Iterable[Tuple], verbose: bool = False) -> List[float]:
+        """
+        Registra varias compras y las persiste en una sola escritura.
+        
+        Args:
+            compras (Iterable[Tuple]): Tuplas (cliente_id, material, peso[, precio_kg])
+            verbose (bool): Muestra un mensaje por cada compra registrada
+            
+        Returns:
+            List[float]: Total de cada compra, en el mismo orden
+        """
+        totales = []
+        eventos = []
+        try:
+            for fila in compras:
+                total, evento = self._crear_compra(*fila)
+                totales.append(total)
+                eventos.append(evento)
+                if verbose:
+                    print(f"✅ Compra registrada: {fila[2]}kg de {fila[1]} = ${total:.2f}")
+        finally:
+            # Las compras ya aplicadas se persisten aunque una fila sea inválida
+            self._registrar_eventos(eventos)
+        return totales
+    
+    def _crear_compra(self, cliente_id: int, material: str, peso: float,
+                      precio_kg: Optional[float] = None) -> Tuple[float, Dict]:
+        """Valida y aplica una compra en memoria; devuelve el total y su evento."""
         if cliente_id not in self.clientes:
             raise ValueError(f"Cliente con ID {cliente_id} no encontrado")
         
         if peso <= 0:
             raise ValueError("El peso debe ser mayor a 0")
         
-        material_lower = material.lower()
+        clave = self._clave_material(material)
+        nombre_material = self._nombres_material.setdefault(clave, material.strip().title())
         if precio_kg is None:
-            precio_kg = self.precios_materiales.get(material_lower, 5.0)
+            precio_kg = self.precios_materiales.get(clave, 5.0)
         
         total = peso * precio_kg
-        fecha_actual = datetime.now()
-        
-        compra = {
-            "fecha": fecha_actual.strftime("%Y-%m-%d %H:%M"),
-            "material": material.title(),
-            "peso": peso,
-            "precio_kg": precio_kg,
-            "total": total,
-            "mes": fecha_actual.strftime("%Y-%m")
-        }
         
-        # Actualizar datos del cliente
+        compra = Compra(int(time.time()), nombre_material, peso, precio_kg, total)
+        
+        evento = self._nuevo_evento("compra", cliente_id, compra)
+        self._aplicar_compra(cliente_id, compra, evento["seq"])
+        return total, evento
+    
+    def _aplicar_compra(self, cliente_id: int, compra: Compra, seq: int) -> None:
+        """Actualiza el historial y los acumulados de un cliente con una compra."""
+        historial = self._historiales.get(cliente_id)
+        if historial is not None:
+            historial.append(compra)
+        else:
+            self._compras_pendientes.setdefault(cliente_id, []).append((seq, compra))
+        self._sucios.add(cliente_id)
+        
         cliente = self.clientes[cliente_id]
-        cliente["historial"].append(compra)
-        cliente["compras_totales"] += total
-        cliente["peso_total"] += peso
-        cliente["num_transacciones"] += 1
+        cliente.compras_totales += compra.total
+        cliente.peso_total += compra.peso
+        cliente.num_transacciones += 1
         
-        self.guardar_datos()
-        print(f"✅ Compra registrada: {peso}kg de {material} = ${total:.2f}")
-        return total
+        material = self.nombre_material(compra.material)
+        _acumular_material(cliente.materiales, material, compra.peso, compra.total)
+        if cliente_id not in self.inactivos:
+            _acumular_material(self.materiales_globales, material,
+                               compra.peso, compra.total)
+    
+    def _clave_material(self, material: str) -> str:
+        """Clave normalizada de un material, guardada para no recalcularla."""
+        clave = self._claves_material.get(material)
+        if clave is None:
+            clave = self._claves_material[material] = _normalizar_material(material)
+        return clave
+    
+    def nombre_material(self, material: str) -> str:
+        """
+        Devuelve el nombre a mostrar de un material, escrito de cualquier forma.
+        
+        Args:
+            material (str): Nombre o clave del material (p. ej. "carton" o "Cartón")
+            
+        Returns:
+            str: Nombre único del material, con acentos si es conocido
+        """
+        return self._nombres_material.setdefault(self._clave_material(material),
+                                                 material.strip().title())
     
-    def buscar_cliente(self, termino: str) -> List[Tuple[int, Dict]]:
+    def historial_cliente(self, cliente_id: int) -> List[Compra]:
+        """
+        Devuelve el historial de compras de un cliente, leyéndolo si hace falta.
+        
+        Args:
+            cliente_id (int): ID del cliente
+            
+        Returns:
+            List[Compra]: Compras del cliente en orden de registro
+        """
+        historial = self._historiales.get(cliente_id)
+        if historial is None:
+            historial = self._componer_historial(cliente_id)
+            self._compras_pendientes.pop(cliente_id, None)
+            self._historiales[cliente_id] = historial
+        return historial
+    
+    def _componer_historial(self, cliente_id: int) -> List[Compra]:
+        """Historial completo de un cliente sin dejarlo en memoria (para guardar o exportar)."""
+        historial = self._historiales.get(cliente_id)
+        if historial is not None:
+            return historial
+        seq_archivo, historial = self._leer_historial(cliente_id)
+        # El archivo puede ya incluir compras que siguen en la bitácora
+        historial.extend(compra for seq, compra in self._compras_pendientes.get(cliente_id, [])
+                         if seq > seq_archivo)
+        return historial
+    
+    def _ruta_historial(self, cliente_id: int) -> str:
+        """Ruta del archivo de historial de un cliente."""
+        return os.path.join(self.directorio_historial, f"{cliente_id}.json")
+    
+    def _leer_historial(self, cliente_id: int) -> Tuple[int, List[Compra]]:
+        """Lee el archivo de historial de un cliente; devuelve (seq, compras)."""
+        ruta = self._ruta_historial(cliente_id)
+        if not os.path.exists(ruta):
+            return 0, []
+        data = _cargar_json_archivo(ruta)
+        return data["seq"], [Compra.desde_dict(c) for c in data["historial"]]
+    
+    def _indexar_busqueda(self, cliente_id: int, datos: Cliente) -> None:
+        """Guarda nombre y dirección en minúsculas para buscar_cliente."""
+        self._indice_busqueda[cliente_id] = (datos.nombre.lower(),
+                                             datos.direccion.lower())
+    
+    def buscar_cliente(self, termino: str) -> List[Tuple[int, Cliente]]:
         """
         Busca clientes por nombre o teléfono.
         
@@ -152,7 +453,7 @@ class SistemaClientes:
             termino (str): Término de búsqueda
             
         Returns:
-            List[Tuple[int, Dict]]: Lista de tuplas (ID, datos_cliente)
+            List[Tuple[int, Cliente]]: Lista de tuplas (ID, datos_cliente)
         """
         if not termino.strip():
             return []
@@ -160,17 +461,18 @@ class SistemaClientes:
         termino_lower = termino.lower().strip()
         resultados = []
         
-        for id_cliente, datos in self.clientes.items():
-            if not datos["activo"]:
+        for id_cliente, (nombre_lower, direccion_lower) in self._indice_busqueda.items():
+            if id_cliente in self.inactivos:
                 continue
                 
-            if (termino_lower in datos["nombre"].lower() or 
-                termino in datos["telefono"] or
-                termino_lower in datos["direccion"].lower()):
+            datos = self.clientes[id_cliente]
+            if (termino_lower in nombre_lower or 
+                termino in datos.telefono or
+                termino_lower in direccion_lower):
                 resultados.append((id_cliente, datos))
         
         # Ordenar por nombre
-        resultados.sort(key=lambda x: x[1]["nombre"])
+        resultados.sort(key=lambda x: x[1].nombre)
         return resultados
     
     def reporte_cliente(self, cliente_id: int) -> None:
@@ -185,43 +487,38 @@ class SistemaClientes:
             return
         
         cliente = self.clientes[cliente_id]
+        historial = self.historial_cliente(cliente_id)
+        
+        lineas = []
+        lineas.append(f"\n{'='*50}")
+        lineas.append(f"📊 REPORTE DETALLADO - CLIENTE {cliente_id}")
+        lineas.append(f"{'='*50}")
+        lineas.append(f"👤 Nombre: {cliente.nombre}")
+        lineas.append(f"📞 Teléfono: {cliente.telefono}")
+        lineas.append(f"📍 Dirección: {cliente.direccion}")
+        lineas.append(f"📅 Registro: {cliente.fecha_registro}")
+        lineas.append(f"💰 Total comprado: ${cliente.compras_totales:.2f}")
+        lineas.append(f"⚖️  Peso total: {cliente.peso_total:.2f} kg")
+        lineas.append(f"📋 Transacciones: {cliente.num_transacciones}")
         
-        print(f"\n{'='*50}")
-        print(f"📊 REPORTE DETALLADO - CLIENTE {cliente_id}")
-        print(f"{'='*50}")
-        print(f"👤 Nombre: {cliente['nombre']}")
-        print(f"📞 Teléfono: {cliente['telefono']}")
-        print(f"📍 Dirección: {cliente['direccion']}")
-        print(f"📅 Registro: {cliente['fecha_registro']}")
-        print(f"💰 Total comprado: ${cliente['compras_totales']:.2f}")
-        print(f"⚖️  Peso total: {cliente['peso_total']:.2f} kg")
-        print(f"📋 Transacciones: {cliente['num_transacciones']}")
-        
-        if cliente['historial']:
-            print(f"\n📈 ÚLTIMAS 5 COMPRAS:")
-            print("-" * 50)
-            for compra in cliente['historial'][-5:]:
-                print(f"{compra['fecha']}: {compra['material']} "
-                      f"{compra['peso']}kg @ ${compra['precio_kg']:.2f}/kg = ${compra['total']:.2f}")
+        if historial:
+            lineas.append(f"\n📈 ÚLTIMAS 5 COMPRAS:")
+            lineas.append("-" * 50)
+            for compra in historial[-5:]:
+                lineas.append(f"{compra.fecha}: {compra.material} "
+                              f"{compra.peso}kg @ ${compra.precio_kg:.2f}/kg = ${compra.total:.2f}")
             
             # Análisis de materiales más comprados
-            materiales_count = {}
-            for compra in cliente['historial']:
-                mat = compra['material']
-                if mat not in materiales_count:
-                    materiales_count[mat] = {'peso': 0, 'total': 0, 'count': 0}
-                materiales_count[mat]['peso'] += compra['peso']
-                materiales_count[mat]['total'] += compra['total']
-                materiales_count[mat]['count'] += 1
-            
-            print(f"\n🔍 ANÁLISIS POR MATERIAL:")
-            print("-" * 50)
-            for material, stats in sorted(materiales_count.items(), 
+            lineas.append(f"\n🔍 ANÁLISIS POR MATERIAL:")
+            lineas.append("-" * 50)
+            for material, stats in sorted(cliente.materiales.items(), 
                                         key=lambda x: x[1]['total'], reverse=True):
-                print(f"{material}: {stats['peso']:.1f}kg, "
-                      f"${stats['total']:.2f}, {stats['count']} compras")
+                lineas.append(f"{material}: {stats['peso']:.1f}kg, "
+                              f"${stats['total']:.2f}, {stats['count']} compras")
         else:
-            print("\n📝 Sin historial de compras")
+            lineas.append("\n📝 Sin historial de compras")
+        
+        sys.stdout.write("\n".join(lineas) + "\n")
     
     def top_clientes(self, limite: int = 10, criterio: str = "total") -> None:
         """
@@ -245,25 +542,26 @@ class SistemaClientes:
             criterio = "total"
         
         campo = criterios_map[criterio]
-        clientes_activos = [(id_c, datos) for id_c, datos in self.clientes.items() 
-                           if datos["activo"]]
+        clientes_activos = [datos for id_c, datos in self.clientes.items()
+                            if id_c not in self.inactivos]
         
-        clientes_ordenados = sorted(clientes_activos, 
-                                  key=lambda x: x[1][campo], 
-                                  reverse=True)
+        clientes_ordenados = heapq.nlargest(limite, clientes_activos, key=attrgetter(campo))
         
-        print(f"\n🏆 TOP {limite} CLIENTES - Por {criterio.title()}")
-        print("=" * 60)
+        lineas = []
+        lineas.append(f"\n🏆 TOP {limite} CLIENTES - Por {criterio.title()}")
+        lineas.append("=" * 60)
         
-        for i, (id_cliente, datos) in enumerate(clientes_ordenados[:limite], 1):
+        for i, datos in enumerate(clientes_ordenados, 1):
             if criterio == "total":
-                valor = f"${datos['compras_totales']:.2f}"
+                valor = f"${datos.compras_totales:.2f}"
             elif criterio == "peso":
-                valor = f"{datos['peso_total']:.1f}kg"
+                valor = f"{datos.peso_total:.1f}kg"
             else:
-                valor = f"{datos['num_transacciones']} compras"
+                valor = f"{datos.num_transacciones} compras"
             
-            print(f"{i:2d}. {datos['nombre']:<25} - {valor}")
+            lineas.append(f"{i:2d}. {datos.nombre:<25} - {valor}")
+        
+        sys.stdout.write("\n".join(lineas) + "\n")
     
     def estadisticas_generales(self) -> None:
         """Muestra estadísticas generales del negocio."""
@@ -271,44 +569,39 @@ class SistemaClientes:
             print("📝 No hay datos para mostrar estadísticas")
             return
         
-        clientes_activos = [datos for datos in self.clientes.values() if datos["activo"]]
+        clientes_activos = [datos for id_c, datos in self.clientes.items()
+                            if id_c not in self.inactivos]
         total_clientes = len(clientes_activos)
         
         if total_clientes == 0:
             print("📝 No hay clientes activos")
             return
         
-        ventas_totales = sum(c["compras_totales"] for c in clientes_activos)
-        peso_total = sum(c["peso_total"] for c in clientes_activos)
-        transacciones_totales = sum(c["num_transacciones"] for c in clientes_activos)
+        ventas_totales = sum(map(attrgetter("compras_totales"), clientes_activos))
+        peso_total = sum(map(attrgetter("peso_total"), clientes_activos))
+        transacciones_totales = sum(map(attrgetter("num_transacciones"), clientes_activos))
         
-        print(f"\n📊 ESTADÍSTICAS GENERALES")
-        print("=" * 40)
-        print(f"👥 Clientes activos: {total_clientes}")
-        print(f"💰 Ventas totales: ${ventas_totales:.2f}")
-        print(f"⚖️  Peso total procesado: {peso_total:.2f} kg")
-        print(f"📋 Total transacciones: {transacciones_totales}")
+        lineas = []
+        lineas.append(f"\n📊 ESTADÍSTICAS GENERALES")
+        lineas.append("=" * 40)
+        lineas.append(f"👥 Clientes activos: {total_clientes}")
+        lineas.append(f"💰 Ventas totales: ${ventas_totales:.2f}")
+        lineas.append(f"⚖️  Peso total procesado: {peso_total:.2f} kg")
+        lineas.append(f"📋 Total transacciones: {transacciones_totales}")
         
         if transacciones_totales > 0:
-            print(f"💵 Venta promedio: ${ventas_totales/transacciones_totales:.2f}")
-            print(f"📈 Peso promedio por transacción: {peso_total/transacciones_totales:.2f} kg")
+            lineas.append(f"💵 Venta promedio: ${ventas_totales/transacciones_totales:.2f}")
+            lineas.append(f"📈 Peso promedio por transacción: {peso_total/transacciones_totales:.2f} kg")
         
         # Análisis de materiales más vendidos
-        materiales_globales = {}
-        for cliente in clientes_activos:
-            for compra in cliente["historial"]:
-                mat = compra["material"]
-                if mat not in materiales_globales:
-                    materiales_globales[mat] = {"peso": 0, "total": 0}
-                materiales_globales[mat]["peso"] += compra["peso"]
-                materiales_globales[mat]["total"] += compra["total"]
-        
-        if materiales_globales:
-            print(f"\n🔍 MATERIALES MÁS VENDIDOS:")
-            print("-" * 40)
-            for material, stats in sorted(materiales_globales.items(), 
+        if self.materiales_globales:
+            lineas.append(f"\n🔍 MATERIALES MÁS VENDIDOS:")
+            lineas.append("-" * 40)
+            for material, stats in sorted(self.materiales_globales.items(), 
                                         key=lambda x: x[1]["total"], reverse=True)[:5]:
-                print(f"{material}: {stats['peso']:.1f}kg, ${stats['total']:.2f}")
+                lineas.append(f"{material}: {stats['peso']:.1f}kg, ${stats['total']:.2f}")
+        
+        sys.stdout.write("\n".join(lineas) + "\n")
     
     def exportar_datos(self, formato: str = "json") -> str:
         """
@@ -320,48 +613,320 @@ class SistemaClientes:
         Returns:
             str: Nombre del archivo generado
         """
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        timestamp = time.strftime("%Y%m%d_%H%M%S")
         
         if formato.lower() == "json":
             archivo = f"backup_clientes_{timestamp}.json"
-            with open(archivo, "w", encoding="utf-8") as f:
-                json.dump(self.clientes, f, indent=2, ensure_ascii=False)
+            # Se escribe cliente por cliente para no tener todos los historiales
+            # en memoria; el resultado es igual a serializar el dict completo
+            with open(archivo, "wb") as f:
+                f.write(b"{")
+                for i, (id_cliente, datos) in enumerate(self.clientes.items()):
+                    entrada = _json_dumps({**asdict(datos),
+                                           "activo": id_cliente not in self.inactivos,
+                                           "historial": self._componer_historial(id_cliente)})
+                    f.write(b"," if i else b"")
+                    f.write(b'\n  "%d": ' % id_cliente + entrada.replace(b"\n", b"\n  "))
+                f.write(b"\n}" if self.clientes else b"}")
         
         elif formato.lower() == "csv":
             archivo = f"reporte_clientes_{timestamp}.csv"
-            with open(archivo, "w", encoding="utf-8") as f:
-                f.write("ID,Nombre,Telefono,Direccion,Fecha_Registro,Total_Compras,Peso_Total,Num_Transacciones\n")
-                for id_cliente, datos in self.clientes.items():
-                    f.write(f"{id_cliente},{datos['nombre']},{datos['telefono']},"
-                           f"{datos['direccion']},{datos['fecha_registro']},"
-                           f"{datos['compras_totales']:.2f},{datos['peso_total']:.2f},"
-                           f"{datos['num_transacciones']}\n")
+            with open(archivo, "w", encoding="utf-8", newline="") as f:
+                writer = csv.writer(f, lineterminator="\n")
+                writer.writerow(["ID", "Nombre", "Telefono", "Direccion", "Fecha_Registro",
+                                 "Total_Compras", "Peso_Total", "Num_Transacciones"])
+                writer.writerows(
+                    (id_cliente, datos.nombre, datos.telefono,
+                     datos.direccion, datos.fecha_registro,
+                     f"{datos.compras_totales:.2f}", f"{datos.peso_total:.2f}",
+                     datos.num_transacciones)
+                    for id_cliente, datos in self.clientes.items()
+                )
         
         print(f"✅ Datos exportados a: {archivo}")
         return archivo
     
-    def guardar_datos(self) -> None:
-        """Guarda los datos en el archivo JSON."""
+    def guardar_datos(self) -> bool:
+        """
+        Guarda el resumen de clientes y los historiales modificados.
+        
+        Returns:
+            bool: True si todos los archivos se escribieron correctamente
+        """
+        if self._carga_fallida:
+            print("❌ No se guardan datos: la carga inicial falló y se conservan los archivos existentes")
+            return False
+        
+        if not self._archivos_vigentes():
+            return False
+        
         try:
-            with open(self.archivo_datos, "w", encoding="utf-8") as f:
-                json.dump(self.clientes, f, indent=2, ensure_ascii=False)
+            # Los historiales se escriben antes que el resumen: si el proceso
+            # se interrumpe, el número de secuencia evita duplicar compras.
+            if self._sucios:
+                os.makedirs(self.directorio_historial, exist_ok=True)
+            for cliente_id in sorted(self._sucios):
+                _escribir_json_atomico(self._ruta_historial(cliente_id),
+                                       {"seq": self._seq,
+                                        "historial": self._componer_historial(cliente_id)})
+                # El archivo ya incluye todo: se libera de memoria
+                self._historiales.pop(cliente_id, None)
+                self._compras_pendientes.pop(cliente_id, None)
+            _escribir_json_atomico(self.archivo_datos,
+                                   {"seq": self._seq,
+                                    "inactivos": sorted(self.inactivos),
+                                    "clientes": self.clientes})
+            self._snapshot_conocido = self._estado_snapshot()
+            self._sucios.clear()
+            return True
         except Exception as e:
             print(f"❌ Error al guardar datos: {e}")
+            return False
+    
+    def _estado_snapshot(self) -> Optional[Tuple[int, int, int]]:
+        """Inodo, fecha de modificación y tamaño del snapshot (None si no existe)."""
+        try:
+            st = os.stat(self.archivo_datos)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+    
+    def _archivos_vigentes(self) -> bool:
+        """
+        Comprueba que ninguna otra instancia modificó el snapshot o la bitácora.
+        
+        Returns:
+            bool: False si los archivos cambiaron; a partir de entonces esta
+            instancia no vuelve a escribir en ellos
+        """
+        if not self._desactualizado:
+            try:
+                tam_bitacora = os.path.getsize(self.archivo_bitacora)
+            except FileNotFoundError:
+                tam_bitacora = 0
+            self._desactualizado = (self._estado_snapshot() != self._snapshot_conocido
+                                    or tam_bitacora != self._tam_bitacora)
+            if self._desactualizado:
+                print("❌ Otra instancia modificó los datos; los cambios de esta sesión "
+                      "no se guardarán. Reinicia el sistema.")
+        return not self._desactualizado
+    
+    def _nuevo_evento(self, op: str, cliente_id: int, data: Dict) -> Dict:
+        """Crea un evento de bitácora con el siguiente número de secuencia."""
+        self._seq += 1
+        return {"seq": self._seq, "op": op, "id": cliente_id, "data": data}
+    
+    def _registrar_evento(self, evento: Dict) -> None:
+        """
+        Agrega un evento a la bitácora sin reescribir el snapshot.
+        
+        Args:
+            evento (dict): Cambio a persistir ('add_client' o 'compra')
+        """
+        self._registrar_eventos([evento])
+    
+    def _registrar_eventos(self, eventos: List[Dict]) -> None:
+        """Agrega varios eventos a la bitácora con una sola escritura."""
+        if not eventos:
+            return
+        
+        if self._carga_fallida:
+            print("❌ No se guardan datos: la carga inicial falló y se conservan los archivos existentes")
+            return
+        
+        if not self._archivos_vigentes():
+            return
+        
+        try:
+            if self._bitacora is None:
+                self._bitacora = open(self.archivo_bitacora, "ab")
+            lineas = b"".join(_json_dumps(evento, indentar=False) + b"\n"
+                              for evento in eventos)
+            self._bitacora.write(lineas)
+            self._bitacora.flush()
+            self._tam_bitacora += len(lineas)
+            self._eventos_pendientes += len(eventos)
+        except Exception as e:
+            print(f"❌ Error al guardar datos: {e}")
+            return
+        
+        if self._eventos_pendientes >= self.EVENTOS_POR_COMPACTACION:
+            self.compactar()
+    
+    def compactar(self) -> None:
+        """Escribe un snapshot y vacía la bitácora de cambios."""
+        if not self._eventos_pendientes and not self._sucios:
+            return
+        if not self.guardar_datos():
+            return
+        try:
+            if self._lineas_rechazadas:
+                self._conservar_rechazados(b"".join(self._lineas_rechazadas))
+                self._lineas_rechazadas = []
+            if self._bitacora is not None:
+                self._bitacora.close()
+            self._bitacora = open(self.archivo_bitacora, "wb")
+            self._tam_bitacora = 0
+            self._eventos_pendientes = 0
+        except Exception as e:
+            print(f"❌ Error al vaciar bitácora: {e}")
     
     def cargar_datos(self) -> None:
-        """Carga los datos desde el archivo JSON."""
+        """Carga el resumen de clientes y reaplica los eventos de la bitácora."""
         try:
             if os.path.exists(self.archivo_datos):
-                with open(self.archivo_datos, "r", encoding="utf-8") as f:
-                    data = json.load(f)
-                    self.clientes = {int(k): v for k, v in data.items()}
+                data = _cargar_json_archivo(self.archivo_datos)
+                if "clientes" in data:
+                    self._seq = data["seq"]
+                    self.inactivos = set(data.get("inactivos", []))
+                    data = data["clientes"]
+                # Sin "clientes" es el formato anterior (historiales incluidos),
+                # que _importar_cliente separa y migra
+                self.clientes = {int(k): self._importar_cliente(int(k), v)
+                                 for k, v in data.items()}
                 print(f"✅ Datos cargados: {len(self.clientes)} clientes")
             else:
                 print("📝 Archivo de datos no encontrado, iniciando nuevo sistema")
+            self._reaplicar_bitacora()
+            self._snapshot_conocido = self._estado_snapshot()
+            if os.path.exists(self.archivo_bitacora):
+                self._tam_bitacora = os.path.getsize(self.archivo_bitacora)
         except Exception as e:
             print(f"❌ Error al cargar datos: {e}")
-            print("📝 Iniciando con base de datos vacía")
+            print("📝 Iniciando con base de datos vacía (los archivos existentes no se modificarán)")
+            self._carga_fallida = True
+            self._seq = 0
+            self._eventos_pendientes = 0
             self.clientes = {}
+            self.inactivos = set()
+            self._historiales = {}
+            self._compras_pendientes = {}
+            self._sucios = set()
+        self._reconstruir_indices()
+    
+    def _reconstruir_indices(self) -> None:
+        """Reconstruye los índices de búsqueda, el siguiente ID y los acumulados globales."""
+        self._indice_telefonos = {datos.telefono: cliente_id
+                                  for cliente_id, datos in self.clientes.items()}
+        self._indice_busqueda = {}
+        for cliente_id, datos in self.clientes.items():
+            self._indexar_busqueda(cliente_id, datos)
+        self._siguiente_id = max(self.clientes.keys(), default=0) + 1
+        
+        self.materiales_globales = {}
+        for cliente_id, datos in self.clientes.items():
+            if cliente_id in self.inactivos:
+                continue
+            for mat, stats in datos.materiales.items():
+                _acumular_material(self.materiales_globales, mat, stats["peso"],
+                                   stats["total"], stats["count"])
+    
+    def _importar_cliente(self, cliente_id: int, datos: Dict) -> Cliente:
+        """
+        Convierte un cliente leído de JSON, adaptando campos de versiones anteriores.
+        
+        'activo' pasa al conjunto de inactivos; un 'historial' incluido se
+        separa a su archivo y, si faltan, se calculan los acumulados por material.
+        """
+        if not datos.pop("activo", True):
+            self.inactivos.add(cliente_id)
+        
+        if "historial" in datos:
+            historial = [Compra.desde_dict(c) for c in datos.pop("historial")]
+            self._historiales[cliente_id] = historial
+            self._sucios.add(cliente_id)
+            if "materiales" not in datos:
+                materiales = datos["materiales"] = {}
+                for compra in historial:
+                    _acumular_material(materiales, self.nombre_material(compra.material),
+                                       compra.peso, compra.total)
+        if "materiales" in datos:
+            # Versiones anteriores podían separar "Carton" y "Cartón"
+            materiales = {}
+            for material, stats in datos["materiales"].items():
+                _acumular_material(materiales, self.nombre_material(material),
+                                   stats["peso"], stats["total"], stats["count"])
+            datos["materiales"] = materiales
+        return Cliente(**datos)
+    
+    def _reaplicar_bitacora(self) -> None:
+        """Reaplica sobre el snapshot los eventos pendientes de la bitácora."""
+        if not os.path.exists(self.archivo_bitacora):
+            return
+        
+        with open(self.archivo_bitacora, "rb") as f:
+            contenido = f.read()
+        
+        # Una última línea sin '\n' quedó a medias por un cierre inesperado:
+        # se conserva aparte y se recorta para que las escrituras nuevas no
+        # se peguen a ella.
+        fin = contenido.rfind(b"\n") + 1
+        if fin < len(contenido):
+            print("⚠️  Última línea incompleta de la bitácora apartada en "
+                  f"{self.archivo_rechazados}")
+            self._conservar_rechazados(contenido[fin:] + b"\n")
+            with open(self.archivo_bitacora, "r+b") as f:
+                f.truncate(fin)
+        
+        seq_snapshot = self._seq
+        aplicados = 0
+        for linea in contenido[:fin].splitlines(keepends=True):
+            if not linea.strip():
+                continue
+            try:
+                evento = _json_loads(linea)
+            except ValueError:
+                print("⚠️  Línea inválida de la bitácora omitida")
+                self._lineas_rechazadas.append(linea)
+                continue
+            self._eventos_pendientes += 1
+            seq = evento.get("seq", self._seq + 1)
+            if seq <= seq_snapshot:
+                # Ya incluido en el snapshot (compactación interrumpida)
+                continue
+            self._seq = max(self._seq, seq)
+            
+            try:
+                self._reaplicar_evento(evento, seq)
+            except (KeyError, TypeError, ValueError) as e:
+                # Un evento inválido no debe impedir cargar el resto
+                print(f"⚠️  Evento {seq} de la bitácora omitido: {e!r}")
+                self._lineas_rechazadas.append(linea)
+                continue
+            aplicados += 1
+        
+        if aplicados:
+            print(f"✅ Cambios recuperados de la bitácora: {aplicados}")
+    
+    def _conservar_rechazados(self, lineas: bytes) -> None:
+        """Agrega líneas de bitácora no aplicadas al archivo de rechazados."""
+        with open(self.archivo_rechazados, "ab") as f:
+            f.write(lineas)
+    
+    def _reaplicar_evento(self, evento: Dict, seq: int) -> None:
+        """Aplica un evento de la bitácora; lanza KeyError si no es aplicable."""
+        cliente_id = evento["id"]
+        if evento["op"] == "add_client":
+            self.clientes[cliente_id] = self._importar_cliente(cliente_id, evento["data"])
+            self._historiales.setdefault(cliente_id, [])
+            self._sucios.add(cliente_id)
+        elif evento["op"] == "compra":
+            if cliente_id not in self.clientes:
+                raise KeyError(f"cliente {cliente_id} no encontrado")
+            self._aplicar_compra(cliente_id, Compra.desde_dict(evento["data"]), seq)
+
+
+# Instancias a compactar al salir (uso desde scripts); referencias débiles para
+# no mantenerlas vivas. menu_principal compacta explícitamente al salir.
+_instancias_abiertas = weakref.WeakSet()
+
+
+@atexit.register
+def _compactar_instancias() -> None:
+    """Compacta las instancias abiertas, de la más reciente a la más antigua."""
+    for sistema in sorted(_instancias_abiertas, key=lambda s: s._seq, reverse=True):
+        sistema.compactar()
+
 
 def mostrar_menu() -> None:
     """Muestra el menú principal."""
@@ -384,17 +949,17 @@ def configurar_precios(sistema: SistemaClientes) -> None:
     print("\n💰 PRECIOS ACTUALES:")
     print("-" * 30)
     for material, precio in sistema.precios_materiales.items():
-        print(f"{material.title()}: ${precio:.2f}/kg")
+        print(f"{sistema.nombre_material(material)}: ${precio:.2f}/kg")
     
     print("\n¿Qué material quieres actualizar?")
-    material = input("Material: ").lower().strip()
+    material = _normalizar_material(input("Material: "))
     
     if material in sistema.precios_materiales:
         try:
-            nuevo_precio = float(input(f"Nuevo precio para {material} (actual: ${sistema.precios_materiales[material]:.2f}): $"))
+            nuevo_precio = float(input(f"Nuevo precio para {sistema.nombre_material(material)} (actual: ${sistema.precios_materiales[material]:.2f}): $"))
             if nuevo_precio > 0:
                 sistema.precios_materiales[material] = nuevo_precio
-                print(f"✅ Precio actualizado: {material} = ${nuevo_precio:.2f}/kg")
+                print(f"✅ Precio actualizado: {sistema.nombre_material(material)} = ${nuevo_precio:.2f}/kg")
             else:
                 print("❌ El precio debe ser mayor a 0")
         except ValueError:
@@ -439,14 +1004,14 @@ def menu_principal():
                     # Mostrar cliente
                     if cliente_id in sistema.clientes:
                         cliente = sistema.clientes[cliente_id]
-                        print(f"Cliente: {cliente['nombre']} - {cliente['telefono']}")
+                        print(f"Cliente: {cliente.nombre} - {cliente.telefono}")
                     else:
                         print("❌ Cliente no encontrado")
                         continue
                     
                     print("\nMateriales disponibles:")
                     for mat, precio in sistema.precios_materiales.items():
-                        print(f"  • {mat.title()}: ${precio:.2f}/kg")
+                        print(f"  • {sistema.nombre_material(mat)}: ${precio:.2f}/kg")
                     
                     material = input("\nMaterial: ").strip()
                     peso = float(input("Peso en kg: "))
@@ -472,7 +1037,7 @@ def menu_principal():
                     print(f"\n✅ Encontrados {len(resultados)} resultados:")
                     print("-" * 60)
                     for id_cliente, datos in resultados:
-                        print(f"ID: {id_cliente} | {datos['nombre']} | {datos['telefono']} | ${datos['compras_totales']:.2f}")
+                        print(f"ID: {id_cliente} | {datos.nombre} | {datos.telefono} | ${datos.compras_totales:.2f}")
                 else:
                     print("❌ No se encontraron clientes")
             
@@ -509,6 +1074,7 @@ def menu_principal():
                 configurar_precios(sistema)
             
             elif opcion == "9":
+                sistema.compactar()
                 print("\n👋 ¡Gracias por usar el Sistema de Clientes!")
                 print("💾 Datos guardados automáticamente")
                 break
@@ -517,6 +1083,7 @@ def menu_principal():
                 print("❌ Opción no válida. Elige un número del 1 al 9")
         
         except KeyboardInterrupt:
+            sistema.compactar()
             print("\n\n👋 ¡Hasta luego!")
             break
         except Exception as e: